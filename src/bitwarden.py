@@ -1,9 +1,6 @@
 #!/usr/bin/env python3
 
-from lib import api
 import os, sys
-import getpass
-import subprocess
 
 def getdv(element, *keys, default=None):
     '''
@@ -27,16 +24,41 @@ def getdv(element, *keys, default=None):
     
 
 class UI(object):
-    def __init__(self, bw):
+    def __init__(self, bw, index=None, scope=None):
+        from lib import api
+
         self.bw = bw
-        self.query = api.Query(bw)
+        if isinstance(bw, api.MultiWrapper):
+            self.query = api.MultiQuery(bw, index=index, scope=scope)
+        else:
+            self.query = api.Query(bw, index=index, scope=scope)
     
-    def select_from_multiple_matches(self, matches):
+    # Number of ranked matches listed at once, type more text to narrow down.
+    SELECT_LIMIT = 20
+
+    def select_from_multiple_matches(self, matches, query=None):
+        from lib.fuzzy import Matcher
+
         print("Multiple credential found. Which one would you like to use ?")
-        mapping = {str(i): v for i, v in enumerate(matches, 1)}
-        print(self.display_credentials(mapping))
-        value = input("Your choice ? ")
-        return mapping[value]
+        matcher = Matcher(matches)
+        narrow = ""
+        ranked = matcher.rank(query or "")
+        while True:
+            mapping = {str(i): v for i, v in enumerate(ranked[:self.SELECT_LIMIT], 1)}
+            print(self.display_credentials(mapping))
+            if len(ranked) > len(mapping):
+                print(f"... and {len(ranked) - len(mapping)} more, type text to narrow down.")
+
+            value = input("Your choice ? ")
+            if value in mapping:
+                return mapping[value]
+
+            narrowed = matcher.rank(query or "", required=f"{narrow} {value}")
+            if narrowed:
+                narrow = f"{narrow} {value}"
+                ranked = narrowed
+            else:
+                print(f"No match for '{value.strip()}'.")
 
     def select_single_match(self, matches):
         if len(matches) == 0:
@@ -62,15 +84,16 @@ class UI(object):
     def display_credentials(self, mapping):
         result = []
         for val, match in mapping.items():
-            result.append(f"{val}) {self.display_credential(match)}")
+            profile = f"[{match['profile']}] " if 'profile' in match else ""
+            result.append(f"{val}) {profile}{self.display_credential(match)}")
 
         return "\n".join(result)
         
-    def select_match(self, matches):
+    def select_match(self, matches, query=None):
         try:
             return self.select_single_match(matches)
         except ValueError:
-            return self.select_from_multiple_matches(matches)
+            return self.select_from_multiple_matches(matches, query)
             
     def get_value(self, match):
         # Returns passwords or note content depending on the type
@@ -79,14 +102,14 @@ class UI(object):
         elif match['type'] == 2:
             return getdv(match, 'notes', default='<no notes content>')
     
-    def get_match(self, matches):
+    def get_match(self, matches, query=None):
         if not matches or len(matches) == 0:
             print("No matches found")
             return
-        return self.get_value(self.select_match(matches))
+        return self.get_value(self.select_match(matches, query))
 
-    def confirm_delete(self, matches):
-        match = self.select_match(matches)
+    def confirm_delete(self, matches, query=None):
+        match = self.select_match(matches, query)
         print("The following match will be DELETED:")
         print(self.display_credential(match, password=True))
         if input("Confirm? (type 'yes') ").lower() == "yes":
@@ -95,16 +118,21 @@ class UI(object):
         return False
         
     def unlock(self):
+        import getpass
+
+        # With several profiles, sessions are all checked at once first.
         self.bw.try_get_session()
 
-        while not bw.unlocked:
-            email = None
-            if bw.needs_email():
-                email = input("Email: ")
+        for name, bw in getattr(self.bw, 'wrappers', {None: self.bw}).items():
+            profile = f" ({name})" if name else ""
+            while not bw.unlocked:
+                email = None
+                if bw.needs_email():
+                    email = input(f"Email{profile}: ")
 
-            pswd = getpass.getpass('Password: ')
+                pswd = getpass.getpass(f'Password{profile}: ')
 
-            bw.unlock(email, pswd)
+                bw.unlock(email, pswd)
             
     def run_get(self, args):
         if args.username:
@@ -112,14 +140,20 @@ class UI(object):
         else:
             match = self.query.search(args.service)
         return match
+
+    def ranking_query(self, args):
+        # Rank by what was actually searched for, not by the full URL.
+        return self.query.extract_domain_name(args.service)
     
     def command_get(self, args):
         match = self.run_get(args)
-        print(self.get_match(match))
+        print(self.get_match(match, self.ranking_query(args)))
         
     def command_clip(self, args):
+        import subprocess
+
         match = self.run_get(args)
-        result = self.get_match(match)
+        result = self.get_match(match, self.ranking_query(args))
         if result:
             try:
                 old_clipboard = subprocess.run(['wl-paste', '-n'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True).stdout[:-1]
@@ -156,14 +190,77 @@ class UI(object):
             except subprocess.TimeoutExpired:
                 pass
         
+    # Seconds left on a code below which the user is warned it is expiring.
+    TOTP_EXPIRY_WARNING = 5
+
+    def command_totp(self, args):
+        import time
+
+        for service in args.service:
+            matches = [m for m in self.query.search(service) if getdv(m, 'login', 'totp')]
+            if not matches:
+                sys.stderr.write(f"No TOTP found for {service}\n")
+                continue
+            match = self.select_match(matches, self.query.extract_domain_name(service))
+            try:
+                totp = self.query.parse_totp(match)
+            except ValueError as exc:
+                sys.stderr.write(f"Invalid TOTP for {service}: {exc}\n")
+                continue
+            now = time.time()
+            code = totp.code(now)
+            remaining = totp.remaining(now)
+            if remaining <= self.TOTP_EXPIRY_WARNING:
+                sys.stderr.write(f"TOTP for {service} expires in {remaining}s\n")
+            if len(args.service) == 1:
+                print(code)
+            else:
+                print(f"{service}\t{code}")
+
+    def command_attachment(self, args):
+        from lib.attachments import AttachmentManifest
+
+        matches = [m for m in self.query.search(args.service) if m.get('attachments')]
+        if not matches:
+            print("No attachments found")
+            return
+        match = self.select_match(matches, self.ranking_query(args))
+        attachments = self.query.find_attachments(match, args.name)
+        if not attachments:
+            print(f"No attachment named {', '.join(args.name)}")
+            return
+
+        if args.output == '-':
+            if len(attachments) > 1:
+                sys.stderr.write("Only one attachment can be written to stdout\n")
+                return
+            try:
+                self.query.get_attachment(match, attachments[0], sys.stdout.buffer)
+            except ValueError as exc:
+                sys.stderr.write(f"{exc}\n")
+            sys.stdout.buffer.flush()
+            return
+
+        try:
+            results = self.query.download_attachments(
+                match, attachments, args.output, manifest=AttachmentManifest.default(), workers=args.jobs
+            )
+        except ValueError as exc:
+            sys.stderr.write(f"{exc}\n")
+            return
+        for attachment, path, downloaded in results:
+            print(f"{path}{'' if downloaded else ' (unchanged)'}")
+
     def command_rm(self, args):
         match = self.run_get(args)
-        confirmed = ui.confirm_delete(match)
+        confirmed = self.confirm_delete(match, self.ranking_query(args))
         if bool(confirmed):
             self.query.real_delete_credential(confirmed)
             print("Deleted.")
             
     def command_add(self, args):
+        import getpass
+
         args.username = None
         args.password = None
         args.notes = None
@@ -186,42 +283,169 @@ class UI(object):
             
         self.query.add(args)
 
+    def command_reindex(self, args):
+        items = self.query.list_items()
+        print(f"Indexed {len(items)} items.")
+
+
+def command_complete(args):
+    # Runs without the wrapper: completion must never spawn `bw`.
+    from lib.index import NameIndex
+
+    for value in NameIndex.default().complete(args.prefix, limit=args.limit):
+        print(value)
+
 
 VERBS = ['get', 'set', 'del']
-if __name__ == '__main__':
+
+
+def positive_int(value):
+    from argparse import ArgumentTypeError
+
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError(f"must be at least 1, not {value}")
+    return number
+
+
+def build_parser():
+    # Only argparse is needed here: --help and usage errors must not pay for
+    # the wrapper (a `bw` lookup on PATH and a data.json load) or lib.api.
     from argparse import ArgumentParser
-    
-    bw = api.Wrapper()
-    ui = UI(bw)
 
     # Instantiate the parser
     parser = ArgumentParser(description='Bitwarden simple python CLI')
+    parser.add_argument('--profile', action='append', default=[], metavar='NAME=DIR',
+                        help='Query the bw profile in BITWARDENCLI_APPDATA_DIR=DIR too (repeatable)')
+    parser.add_argument('--organization', dest='organizationid', metavar='ID', help='Only items of this organization')
+    parser.add_argument('--collection', dest='collectionid', metavar='ID', help='Only items of this collection')
+    parser.add_argument('--folder', dest='folderid', metavar='ID', help="Only items of this folder ('null' for none)")
+    parser.add_argument('--type', dest='item_type', choices=['login', 'note', 'card', 'identity'],
+                        help='Only items of this type')
+    parser.add_argument('--match-url', dest='url', action='store_true', default=None,
+                        help="Look URLs up with the CLI's URI matching instead of a domain search")
+    parser.add_argument('--no-match-url', dest='url', action='store_false',
+                        help='Look URLs up with a domain search, even if enabled in the config')
+    parser.add_argument('--record', metavar='TRACE', help='Append a redacted trace of the bw calls to TRACE')
+    parser.add_argument('--replay', metavar='TRACE', help='Replay the bw calls recorded in TRACE instead of running bw')
+    parser.add_argument('--replay-speed', type=float, default=1.0, help='Replay speed factor, 0 for no delays')
     subparsers = parser.add_subparsers(help='sub-command help')
 
     # Required positional argument
     parser_get = subparsers.add_parser('get', help='Get a password', aliases=['g', 'ge'])
     parser_get.add_argument('service', type=str, help='Service name')
     parser_get.add_argument('username', type=str, nargs='?', help='The username')
-    parser_get.set_defaults(func=ui.command_get)
-    
+    parser_get.set_defaults(func=UI.command_get)
+
     parser_clip = subparsers.add_parser('clip', help='Copy a password to the clipboard', aliases=['c', 'cl', 'cli'])
     parser_clip.add_argument('service', type=str, help='Service name')
     parser_clip.add_argument('username', type=str, nargs='?', help='The username')
-    parser_clip.set_defaults(func=ui.command_clip)
-    
+    parser_clip.set_defaults(func=UI.command_clip)
+
+    parser_totp = subparsers.add_parser('totp', help='Get TOTP codes', aliases=['t', 'otp'])
+    parser_totp.add_argument('service', type=str, nargs='+', help='Service names')
+    parser_totp.set_defaults(func=UI.command_totp)
+
+    parser_attachment = subparsers.add_parser('attachment', help='Download attachments', aliases=['at', 'att'])
+    parser_attachment.add_argument('service', type=str, help='Service name')
+    parser_attachment.add_argument('name', type=str, nargs='*', help='Attachment file names or ids (default: all)')
+    parser_attachment.add_argument('-o', '--output', type=str, default='.', help="Output directory, or '-' for stdout")
+    parser_attachment.add_argument('-j', '--jobs', type=positive_int, default=4, help='Parallel downloads')
+    parser_attachment.set_defaults(func=UI.command_attachment)
 
     parser_rm = subparsers.add_parser('rm', help='Delete a password', aliases=['r', 'd', 'de', 'del'])
     parser_rm.add_argument('service', type=str, help='Service name')
     parser_rm.add_argument('username', type=str, nargs='?', help='The username')
-    parser_rm.set_defaults(func=ui.command_rm)
-    
+    parser_rm.set_defaults(func=UI.command_rm)
+
     parser_add = subparsers.add_parser('add', help='Add an item', aliases=['ad', 'a', 'n', 'ne', 'new'])
     parser_add.add_argument('type', type=str, choices=['pass', 'note'])
-    parser_add.set_defaults(func=ui.command_add)
+    parser_add.set_defaults(func=UI.command_add)
 
-    args = parser.parse_args()
-    ui.unlock()
-    args.func(args)
+    parser_complete = subparsers.add_parser('complete', help='Complete a service name from the local index')
+    parser_complete.add_argument('prefix', type=str, nargs='?', default='', help='Start of the service name')
+    parser_complete.add_argument('--limit', type=int, default=None, help='Maximum number of completions')
+    parser_complete.set_defaults(func=command_complete, offline=True)
+
+    parser_reindex = subparsers.add_parser('reindex', help='Rebuild the completion index from the whole vault')
+    parser_reindex.set_defaults(func=UI.command_reindex)
+
+    return parser
 
 
+def parse_profiles(specs, environ):
+    """
+    Profiles given as NAME=DIR, on the command line or in BITWARDEN_PROFILES
+    (separated by os.pathsep). Returns a list of (name, appdata dir).
+    """
+    if not specs and environ.get('BITWARDEN_PROFILES'):
+        specs = environ['BITWARDEN_PROFILES'].split(os.pathsep)
 
+    profiles = []
+    for spec in specs:
+        name, sep, path = spec.partition('=')
+        if not sep or not name or not path:
+            raise SystemExit(f"Invalid profile '{spec}', expected NAME=DIR")
+        profiles.append((name, os.path.expanduser(path)))
+    return profiles
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not hasattr(args, 'func'):
+        parser.print_help()
+        return 2
+
+    if getattr(args, 'offline', False):
+        args.func(args)
+        return 0
+
+    from lib import api
+    from lib.index import NameIndex
+
+    if args.replay:
+        from lib.trace import ReplayWrapper
+
+        # Replayed items are pseudonyms: keep them out of the real index.
+        bw = ReplayWrapper(args.replay, speed=args.replay_speed)
+        index = None
+    else:
+        profiles = parse_profiles(args.profile, os.environ)
+        if profiles:
+            bw = api.MultiWrapper(
+                (name, api.Wrapper(appdata_dir=path, session=os.environ.get(f"BW_SESSION_{name.upper()}")))
+                for name, path in profiles
+            )
+        else:
+            bw = api.Wrapper()
+        index = NameIndex.default()
+    if args.record:
+        from lib.trace import Recorder
+
+        recorder = Recorder(args.record)
+        for wrapper in getattr(bw, 'wrappers', {None: bw}).values():
+            wrapper.recorder = recorder
+
+    # Scope options on the command line override the config file.
+    from lib.config import get_config_location, load_scope
+
+    config = get_config_location(os.environ)
+    try:
+        scope = load_scope(config)
+    except ValueError as exc:
+        raise SystemExit(f"{config}: {exc}")
+    options = {'organizationid': 'organizationid', 'collectionid': 'collectionid',
+               'folderid': 'folderid', 'type': 'item_type', 'url': 'url'}
+    for key, dest in options.items():
+        if getattr(args, dest) is not None:
+            scope[key] = getattr(args, dest)
+
+    ui = UI(bw, index=index, scope=scope)
+    ui.unlock()
+    args.func(ui, args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,8 +4,11 @@ import os
 import shutil
 import subprocess
 import sys
+import time
 from urllib.parse import urlsplit
 
+CHUNK_SIZE = 64 * 1024
+
 class BWWrapperError(Exception):
     def __init__(self, msg):
         self.msg = msg
@@ -18,14 +21,23 @@ class BWWrapperWrongPasswordError(Exception):
         
 
 class Wrapper(object):
-    def __init__(self, email=None, password=None):
+    def __init__(self, email=None, password=None, appdata_dir=None, session=None):
         if not self.bitwarden_cli_installed():
             raise BWWrapperError()
         
-        self.environ = os.environ
+        # Each wrapper can use its own CLI profile: `bw` gets this environment.
+        self.environ = dict(os.environ)
+        if appdata_dir:
+            self.environ["BITWARDENCLI_APPDATA_DIR"] = appdata_dir
+            # The shell's session belongs to another profile.
+            self.environ.pop("BW_SESSION", None)
+        if session:
+            self.environ["BW_SESSION"] = session
         location = self.get_db_location(sys.platform)
         self.open_db(location)
         self.unlocked = False
+        # Set to a lib.trace.Recorder to keep a redacted trace of `bw` calls.
+        self.recorder = None
         
     def unlock(self, email=None, password=None):
         try:
@@ -117,29 +129,125 @@ class Wrapper(object):
         return False
 
 
-    def bw(self, *args, session=True):
+    def cli_args(self, args, session=True):
         cli_args = ["bw"]
         if session:
             cli_args += ["--session", self.session]
 
-        cli_args += list(args)
+        return cli_args + list(args)
+
+    def bw(self, *args, session=True):
+        cli_args = self.cli_args(args, session)
 
+        start = time.perf_counter()
         try:
             result = subprocess.run(
-                cli_args, stdout=subprocess.PIPE, check=True
+                cli_args, stdout=subprocess.PIPE, check=True, env=self.environ
             ).stdout.strip()
         except subprocess.CalledProcessError as exc:
             output = exc.stdout.decode("utf-8")
-            if self.wrong_password(output):
+            wrong_password = self.wrong_password(output)
+            if self.recorder is not None:
+                self.recorder.record(
+                    args, time.perf_counter() - start, exc.returncode, output,
+                    error="wrong_password" if wrong_password else "error",
+                )
+            if wrong_password:
                 raise BWWrapperWrongPasswordError("Wrong Password")
             raise ValueError(output) from exc
 
+        if self.recorder is not None:
+            self.recorder.record(args, time.perf_counter() - start, output=result)
         return result
 
+    def bw_stream(self, *args, out, session=True, chunk_size=CHUNK_SIZE):
+        """
+        Like `bw()`, but copy the output to the binary file object `out`
+        chunk by chunk instead of buffering it. Returns the size written.
+        """
+        cli_args = self.cli_args(args, session)
+
+        import tempfile
+
+        start = time.perf_counter()
+        size = 0
+        # stderr goes to a file: a pipe nobody reads until stdout is done
+        # would block bw once it fills up.
+        with tempfile.TemporaryFile() as stderr:
+            with subprocess.Popen(
+                cli_args, stdout=subprocess.PIPE, stderr=stderr, env=self.environ
+            ) as process:
+                for chunk in iter(lambda: process.stdout.read(chunk_size), b""):
+                    out.write(chunk)
+                    size += len(chunk)
+            stderr.seek(0)
+            error = stderr.read()
+
+        if self.recorder is not None:
+            self.recorder.record(
+                args, time.perf_counter() - start, process.returncode,
+                error="error" if process.returncode else None, size=size,
+            )
+        if process.returncode:
+            raise ValueError(error.decode("utf-8", "replace"))
+        return size
+
+
+class MultiWrapper(object):
+    """
+    Several `Wrapper`s, one per Bitwarden CLI profile, keyed by profile name.
+    """
+
+    def __init__(self, wrappers):
+        self.wrappers = dict(wrappers)
+
+    @property
+    def unlocked(self):
+        return all(wrapper.unlocked for wrapper in self.wrappers.values())
+
+    def map(self, function, *args):
+        """
+        Call `function(name, wrapper, *args)` for every profile concurrently
+        and return the results by profile name.
+        A failing profile is reported on stderr and left out of the results,
+        the first error is only raised if every profile failed.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=len(self.wrappers)) as executor:
+            futures = {
+                name: executor.submit(function, name, wrapper, *args)
+                for name, wrapper in self.wrappers.items()
+            }
+
+        results = {}
+        errors = []
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as exc:
+                sys.stderr.write(f"Profile {name} failed: {exc}\n")
+                errors.append(exc)
+        if errors and not results:
+            raise errors[0]
+        return results
+
+    def try_get_session(self):
+        self.map(lambda name, wrapper: wrapper.try_get_session())
+
 
 class Query(object):
-    def __init__(self, bw):
+    ITEM_TYPES = {"login": 1, "note": 2, "card": 3, "identity": 4}
+
+    def __init__(self, bw, index=None, scope=None):
         self.bw = bw
+        self.index = index
+        # Filters applied to every lookup, see lib.config.load_scope.
+        self.scope = dict(scope or {})
+        item_type = self.scope.get("type")
+        if item_type is not None and not isinstance(item_type, int):
+            item_type = self.ITEM_TYPES.get(item_type) or int(item_type)
+        self.item_type = item_type
 
     def extract_domain_name(self, full_url):
         full_domain = urlsplit(full_url).netloc
@@ -163,10 +271,130 @@ class Query(object):
         matches = list(self.match_credentials(credentials, username))
         return matches
         
+    def scope_args(self):
+        from lib.config import SCOPE_FILTERS
+
+        args = []
+        for key in SCOPE_FILTERS:
+            if self.scope.get(key):
+                args += [f"--{key}", self.scope[key]]
+        return args
+
+    def scope_template(self):
+        """
+        Item fields placing a new item in the scope: its folder, and its
+        organization and collection when set.
+        """
+        # "null" and "notnull" are `bw list items` filters, not ids.
+        scope = {k: v for k, v in self.scope.items() if v not in (None, "", "null", "notnull")}
+        fields = {}
+        if "folderid" in scope:
+            fields["folderId"] = scope["folderid"]
+        if "organizationid" in scope:
+            fields["organizationId"] = scope["organizationid"]
+        if "collectionid" in scope:
+            fields["collectionIds"] = [scope["collectionid"]]
+        return fields
+
+    def list_scoped_items(self, *args):
+        results = json.loads(self.bw.bw("list", "items", *args, *self.scope_args()))
+        # `bw list items` has no item type filter.
+        if self.item_type is not None:
+            results = [item for item in results if item.get("type") == self.item_type]
+        return results
+
     def search(self, service):
-        search = self.extract_domain_name(service)
-        results = self.bw.bw("list", "items", "--search", search)
-        return json.loads(results)
+        if self.scope.get("url") and urlsplit(service).netloc:
+            # Let the CLI apply each item's URI match detection.
+            results = self.list_scoped_items("--url", service)
+        else:
+            results = self.list_scoped_items("--search", self.extract_domain_name(service))
+        self.update_index(results)
+        return results
+
+    def list_items(self):
+        results = self.list_scoped_items()
+        self.update_index(results, full=True)
+        return results
+
+    def update_index(self, items, full=False):
+        # The index only speeds up completion: never fail a vault read over it.
+        if self.index is None:
+            return
+        try:
+            self.index.update(items, full=full)
+        except OSError:
+            pass
+
+    def parse_totp(self, credential):
+        from lib.totp import TOTP
+
+        secret = (credential.get("login") or {}).get("totp")
+        if not secret:
+            return None
+        return TOTP.parse(secret)
+
+    def get_totp(self, credential, at=None):
+        # Computed locally from the item: no `bw get totp` round trip.
+        totp = self.parse_totp(credential)
+        if totp is None:
+            return None
+        return totp.code(at)
+
+    def find_attachments(self, credential, names=None):
+        attachments = credential.get("attachments") or []
+        if not names:
+            return attachments
+        return [a for a in attachments if a["fileName"] in names or a["id"] in names]
+
+    def get_attachment(self, credential, attachment, out):
+        return self.bw.bw_stream(
+            "get", "attachment", attachment["id"], "--itemid", credential["id"], "--raw", out=out
+        )
+
+    def download_attachments(self, credential, attachments, directory, manifest=None, workers=4):
+        """
+        Download `attachments` of `credential` into `directory`, several at
+        a time. Files whose size and hash match what `manifest` recorded for
+        the same attachment are left untouched.
+        Returns a list of (attachment, path, downloaded) tuples.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from lib.attachments import attachment_paths, download
+
+        if workers < 1:
+            raise ValueError("At least one download worker is needed")
+        # Checked before anything is downloaded, and no two jobs share a path.
+        paths = attachment_paths(directory, attachments)
+        os.makedirs(directory, exist_ok=True)
+
+        def fetch(attachment, path):
+            if manifest is not None and manifest.unchanged(path, attachment):
+                return attachment, path, None
+            digest = download(path, lambda out: self.get_attachment(credential, attachment, out))
+            return attachment, path, digest
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(fetch, a, p) for a, p in zip(attachments, paths)]
+
+        results = []
+        errors = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as exc:
+                errors.append(exc)
+
+        # Record what did download even if another one failed, so it isn't
+        # fetched again next time.
+        if manifest is not None:
+            for attachment, path, digest in results:
+                if digest:
+                    manifest.record(path, attachment, digest)
+            manifest.save()
+        if errors:
+            raise errors[0]
+        return [(attachment, path, bool(digest)) for attachment, path, digest in results]
 
     def add(self, args):
         #{"organizationId":null,"folderId":null,"type":1,"name":"Item name","notes":"Some notes about this item.","favorite":false,"fields":[],"login":null,"secureNote":null,"card":null,"identity":null}
@@ -189,13 +417,11 @@ class Query(object):
                 "username": username,
                 "password": password, }
         
-        folderid = None
-        
         template = json.loads(template_str)
+        template.update(self.scope_template())
         template.update(
             {
                 "type": typ,
-                "folderId": folderid,
                 "name": args.name,
                 "notes": args.notes,
                 "login": login,
@@ -211,6 +437,7 @@ class Query(object):
         template_str = self.bw.bw("get", "template", "item")
 
         template = json.loads(template_str)
+        template.update(self.scope_template())
         template.update(
             {
                 "name": service,
@@ -229,6 +456,11 @@ class Query(object):
         
     def real_delete_credential(self, credential):
         self.bw.bw("delete", "item", credential["id"])
+        if self.index is not None:
+            try:
+                self.index.remove([credential["id"]])
+            except OSError:
+                pass
 
     def delete_password_dry(self, service, username):
         search = self.extract_domain_name(service)
@@ -238,3 +470,75 @@ class Query(object):
         credential = json.loads(result)
         return credential
 
+
+class MultiQuery(Query):
+    """
+    Runs `Query` lookups on every profile of a `MultiWrapper` at once, so a
+    lookup takes as long as the slowest profile rather than the sum of all.
+    Items are tagged with the name of their profile in "profile", which
+    routes later operations on them back to the right profile.
+    """
+
+    def __init__(self, bw, index=None, scope=None):
+        super().__init__(bw, index, scope)
+        # Only this object writes the index, never the concurrent queries.
+        self.queries = {name: Query(wrapper, scope=scope) for name, wrapper in bw.wrappers.items()}
+        self.default = next(iter(self.queries.values()))
+
+    def fan_out(self, method, *args):
+        def run(name, wrapper):
+            items = getattr(self.queries[name], method)(*args)
+            for item in items:
+                item["profile"] = name
+            return items
+
+        results = self.bw.map(run)
+        return [item for items in results.values() for item in items]
+
+    def query_for(self, credential):
+        return self.queries[credential["profile"]]
+
+    def get_password(self, service, username):
+        results = self.fan_out("get_password", service, username)
+        self.update_index(results)
+        return results
+
+    def search(self, service):
+        results = self.fan_out("search", service)
+        self.update_index(results)
+        return results
+
+    def list_items(self):
+        results = self.fan_out("list_items")
+        self.update_index(results, full=True)
+        return results
+
+    def get_totp(self, credential, at=None):
+        return self.query_for(credential).get_totp(credential, at)
+
+    def find_attachments(self, credential, names=None):
+        return self.query_for(credential).find_attachments(credential, names)
+
+    def get_attachment(self, credential, attachment, out):
+        return self.query_for(credential).get_attachment(credential, attachment, out)
+
+    def download_attachments(self, credential, *args, **kwargs):
+        return self.query_for(credential).download_attachments(credential, *args, **kwargs)
+
+    def real_delete_credential(self, credential):
+        self.query_for(credential).real_delete_credential(credential)
+        if self.index is not None:
+            try:
+                self.index.remove([credential["id"]])
+            except OSError:
+                pass
+
+    def add(self, args):
+        # New items go to the first profile.
+        self.default.add(args)
+
+    def set_password(self, service, username, password):
+        self.default.set_password(service, username, password)
+
+    def delete_password_dry(self, service, username):
+        return self.default.delete_password_dry(service, username)
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+
+from lib.api import CHUNK_SIZE
+from lib.index import get_cache_location
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashingWriter(object):
+    def __init__(self, file):
+        self.file = file
+        self.digest = hashlib.sha256()
+
+    def write(self, chunk):
+        self.digest.update(chunk)
+        return self.file.write(chunk)
+
+
+def download(path, stream):
+    """
+    Call `stream(out)` to write a file to `path`, through a temporary file
+    so an interrupted download never replaces a good one.
+    Returns the sha256 of the written content.
+    """
+    tmp = path + ".part"
+    try:
+        with open(tmp, "wb") as file:
+            writer = HashingWriter(file)
+            stream(writer)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return writer.digest.hexdigest()
+
+
+def attachment_paths(directory, attachments):
+    """
+    Paths to download `attachments` to, all inside `directory`.
+
+    File names come from the vault and may have been written by anyone with
+    access to a shared item: only their base name is used, names that can't
+    be a file are rejected with `ValueError`, and an attachment whose name
+    is already taken on the item gets its id appended.
+    """
+    root = os.path.realpath(directory)
+    paths = []
+    taken = set()
+    for attachment in attachments:
+        name = os.path.basename(attachment["fileName"].replace("\\", "/"))
+        if name in ("", ".", ".."):
+            raise ValueError(f"Invalid attachment file name: {attachment['fileName']!r}")
+        if name in taken:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}-{attachment['id']}{ext}"
+        taken.add(name)
+
+        path = os.path.join(directory, name)
+        if os.path.dirname(os.path.realpath(path)) != root:
+            raise ValueError(f"Attachment {attachment['fileName']!r} would be written outside {directory}")
+        paths.append(path)
+    return paths
+
+
+class AttachmentManifest(object):
+    """
+    Remembers which attachment was downloaded to which path and its hash.
+
+    Bitwarden gives every uploaded attachment a new id, so a local file with
+    the recorded id, the attachment size and the recorded hash is up to date.
+    """
+    FILENAME = "attachments.json"
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "r") as file:
+                self.entries = json.load(file)
+        except (IOError, ValueError):
+            self.entries = {}
+
+    @classmethod
+    def default(cls, environ=os.environ):
+        return cls(os.path.join(get_cache_location(environ), cls.FILENAME))
+
+    def unchanged(self, path, attachment):
+        entry = self.entries.get(os.path.abspath(path))
+        if not entry or entry["id"] != attachment["id"]:
+            return False
+        try:
+            if os.path.getsize(path) != int(attachment["size"]):
+                return False
+        except OSError:
+            return False
+        return file_digest(path) == entry["sha256"]
+
+    def record(self, path, attachment, digest):
+        self.entries[os.path.abspath(path)] = {"id": attachment["id"], "sha256": digest}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        with open(self.path, "w") as file:
+            json.dump(self.entries, file)
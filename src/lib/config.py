@@ -0,0 +1,44 @@
+import configparser
+import os
+
+# `bw list items` filters, see `bw list --help`.
+SCOPE_FILTERS = ("organizationid", "collectionid", "folderid")
+
+
+def get_config_location(environ):
+    base = environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(base, "bitwarden-keyring", "config.ini")
+
+
+def load_scope(path):
+    """
+    Read the [scope] section of the config file:
+
+        [scope]
+        organizationid = <id>
+        collectionid = <id>
+        folderid = <id, null or notnull>
+        type = login
+        url = yes
+
+    Returns a dict suitable for `Query(scope=...)`, empty without config.
+    Raises `ValueError` on an invalid value.
+    """
+    from lib.api import Query
+
+    parser = configparser.ConfigParser()
+    parser.read(path)
+    if not parser.has_section("scope"):
+        return {}
+
+    section = parser["scope"]
+    scope = {key: section[key] for key in SCOPE_FILTERS + ("type",) if section.get(key)}
+    item_types = list(Query.ITEM_TYPES) + [str(t) for t in Query.ITEM_TYPES.values()]
+    if "type" in scope and scope["type"] not in item_types:
+        raise ValueError(f"Invalid item type '{scope['type']}', expected one of {', '.join(Query.ITEM_TYPES)}")
+    if section.get("url"):
+        try:
+            scope["url"] = section.getboolean("url")
+        except ValueError:
+            raise ValueError(f"Invalid url '{section['url']}', expected yes or no") from None
+    return scope
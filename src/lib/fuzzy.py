@@ -0,0 +1,101 @@
+import re
+from urllib.parse import urlsplit
+
+WORD = re.compile(r"[^\W_]+")
+
+
+class Matcher(object):
+    """
+    Ranks vault items against free-text queries.
+
+    Name, URI hosts and username of every item are casefolded and split into
+    tokens once, and each character is mapped to the items containing it.
+    Words that must match can only match items containing all of their
+    characters, so narrowing down only scores those candidates.
+    """
+    NAME_WEIGHT = 3
+    HOST_WEIGHT = 2
+    USERNAME_WEIGHT = 1
+
+    def __init__(self, items):
+        self.items = list(items)
+        self.fields = [self.extract_fields(item) for item in self.items]
+
+        self.chars = {}
+        for position, fields in enumerate(self.fields):
+            for char in set("".join(text for text, _, _ in fields)):
+                self.chars.setdefault(char, set()).add(position)
+
+    def extract_fields(self, item):
+        login = item.get("login") or {}
+        values = [(item.get("name"), self.NAME_WEIGHT)]
+        for uri in login.get("uris") or []:
+            values.append((self.extract_host(uri.get("uri")), self.HOST_WEIGHT))
+        values.append((login.get("username"), self.USERNAME_WEIGHT))
+
+        fields = []
+        for value, weight in values:
+            if value:
+                text = value.casefold()
+                fields.append((text, WORD.findall(text), weight))
+        return fields
+
+    def extract_host(self, uri):
+        if not uri:
+            return None
+        return urlsplit(uri).hostname or uri
+
+    def score_word(self, word, text, tokens):
+        if text == word:
+            return 100
+        if text.startswith(word):
+            return 80
+        if any(token.startswith(word) for token in tokens):
+            return 60
+        if word in text:
+            return 40
+
+        # Subsequence: every character in order, the tighter the better.
+        start = position = text.find(word[0])
+        if start < 0:
+            return 0
+        for char in word[1:]:
+            position = text.find(char, position + 1)
+            if position < 0:
+                return 0
+        return 1 + 20 * len(word) // (position - start + 1)
+
+    def score(self, word, fields):
+        return max(
+            (self.score_word(word, text, tokens) * weight for text, tokens, weight in fields),
+            default=0,
+        )
+
+    def candidates(self, words):
+        positions = set(range(len(self.items)))
+        for char in set("".join(words)):
+            positions &= self.chars.get(char, set())
+        return positions
+
+    def rank(self, query="", required=""):
+        """
+        Return the items sorted by how well they match `query`, best first.
+
+        Every word of `required` must match an item for it to be kept, while
+        the words of `query` only weigh on the order: `bw --search` also
+        matches fields that are not scored here, so those items stay listed.
+        """
+        words = query.casefold().split()
+        required_words = required.casefold().split()
+
+        scored = []
+        for position in sorted(self.candidates(required_words)):
+            fields = self.fields[position]
+            required_scores = [self.score(word, fields) for word in required_words]
+            if not all(required_scores):
+                continue
+            score = sum(required_scores) + sum(self.score(word, fields) for word in words)
+            scored.append((-score, position))
+
+        scored.sort()
+        return [self.items[position] for _, position in scored]
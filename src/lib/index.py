@@ -0,0 +1,108 @@
+import bisect
+import os
+
+
+def get_cache_location(environ):
+    base = environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "bitwarden-keyring")
+
+
+class NameIndex(object):
+    """
+    Sorted on-disk index of item names and URI hosts, used for completion.
+
+    One "key<TAB>value<TAB>item id" line per entry, sorted by key, where key
+    is the casefolded value. A prefix query is a bisect over the lines, so
+    completion only reads one small file and never calls `bw`.
+    The index is written back by `Query` whenever it reads items from the
+    vault, and fully rebuilt by `bitwarden.py reindex`.
+    """
+    FILENAME = "names.idx"
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def default(cls, environ=os.environ):
+        return cls(os.path.join(get_cache_location(environ), cls.FILENAME))
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return file.read().splitlines()
+        except IOError:
+            return []
+
+    def save(self, lines):
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        tmp = self.path + ".tmp"
+        # Names and hosts are sensitive too: keep the index private.
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, "w", encoding="utf-8") as file:
+            file.writelines(line + "\n" for line in lines)
+        os.replace(tmp, self.path)
+
+    def complete(self, prefix, limit=None):
+        lines = self.load()
+        key = prefix.casefold()
+        start = bisect.bisect_left(lines, key)
+
+        seen = set()
+        results = []
+        for line in lines[start:]:
+            if not line.startswith(key):
+                break
+            value = line.split("\t")[1]
+            if value in seen:
+                continue
+            seen.add(value)
+            results.append(value)
+            if limit and len(results) >= limit:
+                break
+        return results
+
+    def entries(self, item):
+        values = {item.get("name")}
+        login = item.get("login") or {}
+        for uri in login.get("uris") or []:
+            values.add(self.extract_host(uri.get("uri")))
+
+        for value in values:
+            if not value:
+                continue
+            value = " ".join(value.split())
+            yield f"{value.casefold()}\t{value}\t{item['id']}"
+
+    def extract_host(self, uri):
+        from urllib.parse import urlsplit
+
+        if not uri:
+            return None
+        host = urlsplit(uri).hostname
+        if host:
+            return host
+        if "/" not in uri and ":" not in uri:
+            # Bare host such as "example.com", as typed in the web vault.
+            return uri.lower()
+        return None
+
+    def update(self, items, full=False):
+        """
+        Merge `items` (as returned by `bw list items`) into the index.
+        With `full`, `items` is the whole vault and replaces the index.
+        """
+        if full:
+            lines = []
+        else:
+            ids = {item["id"] for item in items}
+            lines = [line for line in self.load() if line.rsplit("\t", 1)[-1] not in ids]
+
+        for item in items:
+            lines.extend(self.entries(item))
+        lines.sort()
+        self.save(lines)
+
+    def remove(self, item_ids):
+        ids = set(item_ids)
+        lines = self.load()
+        self.save([line for line in lines if line.rsplit("\t", 1)[-1] not in ids])
@@ -0,0 +1,78 @@
+import base64
+import hmac
+import struct
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+STEAM_ALPHABET = "23456789BCDFGHJKMNPQRTVWXY"
+
+
+def decode_secret(secret):
+    secret = "".join(secret.split()).replace("-", "").upper().rstrip("=")
+    return base64.b32decode(secret + "=" * (-len(secret) % 8))
+
+
+class TOTP(object):
+    """
+    RFC 6238 time-based one-time password generator.
+
+    Accepts the `login.totp` values Bitwarden stores: a bare base32 secret,
+    an `otpauth://totp/...` URI or a `steam://` secret.
+    """
+
+    def __init__(self, secret, digits=6, period=30, algorithm="sha1", steam=False):
+        self.key = decode_secret(secret)
+        self.digits = 5 if steam else digits
+        self.period = period
+        self.algorithm = algorithm.lower()
+        self.steam = steam
+        if self.algorithm not in ("sha1", "sha256", "sha512"):
+            raise ValueError(f"Unsupported TOTP algorithm: {algorithm}")
+        # A 31 bit truncated HMAC has at most 10 decimal digits.
+        if not 1 <= self.digits <= 10:
+            raise ValueError(f"Invalid number of TOTP digits: {digits}")
+        if self.period < 1:
+            raise ValueError(f"Invalid TOTP period: {period}")
+
+    @classmethod
+    def parse(cls, value):
+        value = value.strip()
+        if value.lower().startswith("steam://"):
+            return cls(value[len("steam://"):], steam=True)
+        if not value.lower().startswith("otpauth://"):
+            return cls(value)
+
+        url = urlsplit(value)
+        if url.netloc.lower() != "totp":
+            raise ValueError(f"Unsupported OTP type: {url.netloc}")
+        params = {key.lower(): values[0] for key, values in parse_qs(url.query).items()}
+        if "secret" not in params:
+            raise ValueError("No secret in otpauth URI")
+        return cls(
+            unquote(params["secret"]),
+            digits=int(params.get("digits", 6)),
+            period=int(params.get("period", 30)),
+            algorithm=params.get("algorithm", "sha1"),
+        )
+
+    def counter(self, at=None):
+        return int((time.time() if at is None else at) // self.period)
+
+    def remaining(self, at=None):
+        at = time.time() if at is None else at
+        return self.period - int(at % self.period)
+
+    def code(self, at=None):
+        digest = hmac.new(
+            self.key, struct.pack(">Q", self.counter(at)), self.algorithm
+        ).digest()
+        offset = digest[-1] & 0x0F
+        value = struct.unpack(">I", digest[offset:offset + 4])[0] & 0x7FFFFFFF
+
+        if self.steam:
+            chars = []
+            for _ in range(self.digits):
+                value, index = divmod(value, len(STEAM_ALPHABET))
+                chars.append(STEAM_ALPHABET[index])
+            return "".join(chars)
+        return str(value % 10 ** self.digits).zfill(self.digits)
@@ -0,0 +1,192 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+
+from lib.api import CHUNK_SIZE, BWWrapperWrongPasswordError, Wrapper
+
+WORD = re.compile(r"[^\W_]+")
+SCHEME = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*://")
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+# Item values that are secrets as a whole, not names: never pseudonymized.
+SECRET_KEYS = {"password", "totp", "notes", "value", "card", "identity", "sshKey"}
+# Commands whose values and text output are secrets (master password,
+# session key, encoded item payload...).
+SECRET_COMMANDS = {"unlock", "login", "create item", "edit item", "get password", "get totp", "get notes"}
+
+
+def command_name(args):
+    """
+    The `bw` subcommand of `args`, without its values: "list items" for
+    `list items --search foo`, "unlock" for `unlock --raw <password>`.
+    """
+    words = []
+    for arg in args[:2]:
+        if arg.startswith("-"):
+            break
+        words.append(arg)
+    return " ".join(words)
+
+
+class Redactor(object):
+    """
+    Replaces every word of names, usernames and URIs with a pseudonym of
+    the same length, and secrets entirely with a same-length placeholder.
+
+    Pseudonyms are keyed by a random salt that is never written anywhere,
+    so they can't be reversed, but the same word always gets the same
+    pseudonym within a trace: punctuation, URL structure, case, lengths
+    and repeated words (a name that is also a host) are kept, which is what
+    matching and parsing depend on.
+    """
+
+    def __init__(self, salt=None):
+        self.salt = salt or os.urandom(16)
+
+    def pseudonym(self, word):
+        digest = hmac.new(self.salt, word.casefold().encode("utf-8"), hashlib.sha256).digest()
+        while len(digest) < len(word):
+            digest += hashlib.sha256(digest).digest()
+
+        if word.isdigit():
+            return "".join(str(b % 10) for b in digest[:len(word)])
+        chars = [LETTERS[b % len(LETTERS)] for b in digest[:len(word)]]
+        return "".join(c.upper() if o.isupper() else c for c, o in zip(chars, word))
+
+    def redact_string(self, value):
+        # URL schemes are kept: "https" vs "androidapp" matters to matching.
+        scheme = SCHEME.match(value)
+        scheme = scheme.group() if scheme else ""
+        rest = value[len(scheme):]
+        return scheme + WORD.sub(lambda match: self.pseudonym(match.group()), rest)
+
+    def placeholder(self, value):
+        return "*" * len(value)
+
+    def redact(self, value, secret=False):
+        if isinstance(value, str):
+            return self.placeholder(value) if secret else self.redact_string(value)
+        if isinstance(value, list):
+            return [self.redact(v, secret) for v in value]
+        if isinstance(value, dict):
+            return {k: self.redact(v, secret or k in SECRET_KEYS) for k, v in value.items()}
+        if secret and value is not None:
+            # A PIN or card number can be a JSON number.
+            return self.placeholder(json.dumps(value))
+        # Outside secrets, numbers, booleans and null are item types, flags...
+        return value
+
+    def redact_args(self, args):
+        command = command_name(args)
+        redact = self.placeholder if command in SECRET_COMMANDS else self.redact_string
+        words = command.split()
+        rest = args[len(words):]
+        return words + [arg if arg.startswith("-") else redact(arg) for arg in rest]
+
+    def redact_output(self, output, command=""):
+        text = output.decode("utf-8", "replace") if isinstance(output, bytes) else output
+        # Checked before parsing: "123456" or '"hunter2"' is valid JSON too.
+        if command in SECRET_COMMANDS:
+            return {"text": self.placeholder(text)}
+        try:
+            return {"json": self.redact(json.loads(text))}
+        except ValueError:
+            return {"text": self.redact_string(text)}
+
+
+class Recorder(object):
+    """
+    Appends one JSON line per `bw` call to `path`: subcommand, redacted
+    arguments, duration, exit code and redacted output.
+    """
+
+    def __init__(self, path, redactor=None):
+        self.path = path
+        self.redactor = redactor or Redactor()
+        self.lock = threading.Lock()
+
+    def record(self, args, elapsed, returncode=0, output=None, error=None, size=None):
+        event = {
+            "command": command_name(args),
+            "args": self.redactor.redact_args(list(args)),
+            "elapsed": round(elapsed, 6),
+            "returncode": returncode,
+            "error": error,
+        }
+        if size is not None:
+            event["size"] = size
+        elif output is not None:
+            event.update(self.redactor.redact_output(output, event["command"]))
+
+        with self.lock:
+            with open(self.path, "a") as file:
+                file.write(json.dumps(event) + "\n")
+
+
+class ReplayError(ValueError):
+    pass
+
+
+class ReplayWrapper(Wrapper):
+    """
+    Stands in for `Wrapper` and the `bw` CLI using a trace written by
+    `Recorder`: each call consumes the next recorded event for the same
+    subcommand and takes the recorded time (divided by `speed`, 0 for no
+    delay). No process is spawned and no vault or network is needed.
+    """
+
+    def __init__(self, path, speed=1.0):
+        with open(path, "r") as file:
+            self.events = [json.loads(line) for line in file if line.strip()]
+        self.speed = speed
+        self.lock = threading.Lock()
+
+        self.environ = {}
+        self.db = {"userEmail": "replay"}
+        self.user = "replay"
+        self.session = None
+        self.unlocked = False
+        self.recorder = None
+
+    def try_get_session(self):
+        try:
+            self.bw("sync", session=False)
+        except ReplayError:
+            pass
+        self.session = "replay"
+        self.unlocked = True
+        return self.session
+
+    def next_event(self, args):
+        command = command_name(args)
+        with self.lock:
+            for position, event in enumerate(self.events):
+                if event["command"] == command:
+                    del self.events[position]
+                    break
+            else:
+                raise ReplayError(f"No recorded call left for 'bw {command}'")
+
+        if self.speed:
+            time.sleep(event["elapsed"] / self.speed)
+        if event["error"] == "wrong_password":
+            raise BWWrapperWrongPasswordError("Wrong Password")
+        if event["returncode"]:
+            raise ValueError(event.get("text") or "")
+        return event
+
+    def bw(self, *args, session=True):
+        event = self.next_event(args)
+        if "json" in event:
+            return json.dumps(event["json"]).encode("utf-8")
+        return event.get("text", "").encode("utf-8")
+
+    def bw_stream(self, *args, out, session=True, chunk_size=CHUNK_SIZE):
+        size = self.next_event(args).get("size", 0)
+        for start in range(0, size, chunk_size):
+            out.write(b"\0" * min(chunk_size, size - start))
+        return size
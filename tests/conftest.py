@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+
+import pytest
+
+# bitwarden.py and lib/ live in src/ and are run from there, not installed.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+
+@pytest.fixture(autouse=True)
+def isolated_environ(monkeypatch, tmp_path):
+    # main() reads config, cache and profiles from the environment: never
+    # use the developer's own.
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    for name in ("BITWARDEN_PROFILES", "BW_SESSION", "BITWARDENCLI_APPDATA_DIR"):
+        monkeypatch.delenv(name, raising=False)
+
+
+class FakeWrapper(object):
+    """
+    Stands in for `api.Wrapper`: records the `bw` calls and answers them
+    with `output` (JSON-encoded unless bytes), or raises `error`.
+    With a `barrier`, calls wait for the other wrappers sharing it, which
+    only succeeds if they run concurrently.
+    """
+
+    def __init__(self, output=(), error=None, barrier=None):
+        self.output = output
+        self.error = error
+        self.barrier = barrier
+        self.calls = []
+        self.unlocked = False
+
+    def wait(self):
+        if self.barrier is not None:
+            self.barrier.wait(timeout=5)
+
+    def try_get_session(self):
+        self.wait()
+        self.unlocked = True
+
+    def bw(self, *args, session=True):
+        self.calls.append(args)
+        self.wait()
+        if self.error is not None:
+            raise self.error
+        if isinstance(self.output, bytes):
+            return self.output
+        return json.dumps(self.output).encode("utf-8")
+
+
+@pytest.fixture
+def fake_wrapper():
+    return FakeWrapper
+
+
+@pytest.fixture
+def wrapper():
+    # A real Wrapper, without looking for `bw` or reading data.json.
+    from lib import api
+
+    wrapper = api.Wrapper.__new__(api.Wrapper)
+    wrapper.session = "yo"
+    wrapper.environ = {}
+    wrapper.recorder = None
+    return wrapper
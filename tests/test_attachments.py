@@ -0,0 +1,218 @@
+import argparse
+import hashlib
+import io
+import sys
+
+import pytest
+
+import bitwarden
+from lib import api
+from lib.attachments import AttachmentManifest, attachment_paths, download, file_digest
+
+CONTENT = b"0123456789" * 20000
+
+
+def fake_cli(monkeypatch, wrapper, code):
+    calls = []
+
+    def cli_args(args, session=True):
+        calls.append(list(args))
+        return [sys.executable, "-c", code] + list(args)
+
+    monkeypatch.setattr(wrapper, "cli_args", cli_args)
+    return calls
+
+
+def test_bw_stream(monkeypatch, wrapper):
+    fake_cli(monkeypatch, wrapper, "import sys; sys.stdout.buffer.write(b'0123456789' * 20000)")
+
+    out = io.BytesIO()
+    assert wrapper.bw_stream("get", "attachment", out=out, chunk_size=4096) == len(CONTENT)
+    assert out.getvalue() == CONTENT
+
+
+def test_bw_stream_error(monkeypatch, wrapper):
+    fake_cli(monkeypatch, wrapper, "import sys; sys.stderr.write('Not found.'); sys.exit(1)")
+
+    with pytest.raises(ValueError, match="Not found."):
+        wrapper.bw_stream("get", "attachment", out=io.BytesIO())
+
+
+def test_bw_stream_large_stderr(monkeypatch, wrapper):
+    fake_cli(
+        monkeypatch,
+        wrapper,
+        "import sys; sys.stderr.write('x' * 1000000); sys.stderr.flush(); sys.stdout.write('done'); sys.exit(1)",
+    )
+
+    with pytest.raises(ValueError) as exc:
+        wrapper.bw_stream("get", "attachment", out=io.BytesIO())
+    assert len(str(exc.value)) == 1000000
+
+
+def test_download_failure_keeps_previous_file(tmp_path):
+    path = tmp_path / "kubeconfig"
+    path.write_bytes(b"old")
+
+    def stream(out):
+        out.write(b"partial")
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        download(str(path), stream)
+
+    assert path.read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["kubeconfig"]
+
+
+def test_manifest_unchanged(tmp_path):
+    path = tmp_path / "cert.pem"
+    path.write_bytes(b"cert")
+    attachment = {"id": "a1", "size": "4"}
+    manifest = AttachmentManifest(str(tmp_path / "cache" / "attachments.json"))
+
+    assert not manifest.unchanged(str(path), attachment)
+
+    manifest.record(str(path), attachment, file_digest(str(path)))
+    manifest.save()
+    manifest = AttachmentManifest(manifest.path)
+
+    assert manifest.unchanged(str(path), attachment)
+    # New upload, same name
+    assert not manifest.unchanged(str(path), {"id": "a2", "size": "4"})
+    # Edited locally
+    path.write_bytes(b"CERT")
+    assert not manifest.unchanged(str(path), attachment)
+    path.write_bytes(b"cert!")
+    assert not manifest.unchanged(str(path), attachment)
+
+
+def test_download_attachments(monkeypatch, wrapper, tmp_path):
+    calls = fake_cli(monkeypatch, wrapper, "import sys; sys.stdout.buffer.write(b'0123456789' * 20000)")
+    query = api.Query(wrapper)
+    credential = {
+        "id": "item",
+        "attachments": [
+            {"id": "a1", "fileName": "one", "size": str(len(CONTENT))},
+            {"id": "a2", "fileName": "two", "size": str(len(CONTENT))},
+            {"id": "a3", "fileName": "three", "size": "1"},
+        ],
+    }
+    attachments = query.find_attachments(credential, ["one", "a2"])
+    manifest = AttachmentManifest(str(tmp_path / "attachments.json"))
+
+    results = query.download_attachments(credential, attachments, str(tmp_path), manifest=manifest)
+
+    assert [(a["id"], downloaded) for a, _, downloaded in results] == [("a1", True), ("a2", True)]
+    assert (tmp_path / "two").read_bytes() == CONTENT
+    assert sorted(calls) == [
+        ["get", "attachment", "a1", "--itemid", "item", "--raw"],
+        ["get", "attachment", "a2", "--itemid", "item", "--raw"],
+    ]
+    assert manifest.entries[str(tmp_path / "one")]["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+
+    results = query.download_attachments(credential, attachments, str(tmp_path), manifest=manifest)
+
+    assert [downloaded for _, _, downloaded in results] == [False, False]
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize(
+    "file_name, expected",
+    [
+        ("../../.ssh/authorized_keys", "authorized_keys"),
+        ("/home/u/.bashrc", ".bashrc"),
+        ("..\\..\\evil.bat", "evil.bat"),
+    ],
+)
+def test_attachment_paths_stay_in_directory(tmp_path, file_name, expected):
+    paths = attachment_paths(str(tmp_path), [{"id": "a1", "fileName": file_name}])
+
+    assert paths == [str(tmp_path / expected)]
+
+
+@pytest.mark.parametrize("file_name", ["", ".", "..", "../", "/"])
+def test_attachment_paths_invalid(tmp_path, file_name):
+    with pytest.raises(ValueError):
+        attachment_paths(str(tmp_path), [{"id": "a1", "fileName": file_name}])
+
+
+def test_attachment_paths_symlink_escape(tmp_path):
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "cert.pem").symlink_to(tmp_path / "elsewhere")
+
+    with pytest.raises(ValueError):
+        attachment_paths(str(tmp_path / "out"), [{"id": "a1", "fileName": "cert.pem"}])
+
+
+def test_attachment_paths_duplicates(tmp_path):
+    paths = attachment_paths(
+        str(tmp_path),
+        [{"id": "a1", "fileName": "cert.pem"}, {"id": "a2", "fileName": "cert.pem"}],
+    )
+
+    assert paths == [str(tmp_path / "cert.pem"), str(tmp_path / "cert-a2.pem")]
+
+
+def test_download_attachments_malicious_name(monkeypatch, wrapper, tmp_path):
+    calls = fake_cli(monkeypatch, wrapper, "print('pwned')")
+    credential = {"id": "item", "attachments": [{"id": "a1", "fileName": "../evil", "size": "6"}]}
+    out = tmp_path / "out"
+
+    api.Query(wrapper).download_attachments(credential, credential["attachments"], str(out))
+
+    assert (out / "evil").read_bytes() == b"pwned\n"
+    assert not (tmp_path / "evil").exists()
+    assert len(calls) == 1
+
+
+def test_download_attachments_invalid_workers(wrapper, tmp_path):
+    with pytest.raises(ValueError):
+        api.Query(wrapper).download_attachments({"id": "item"}, [], str(tmp_path), workers=0)
+
+
+def test_jobs_must_be_positive():
+    with pytest.raises(SystemExit):
+        bitwarden.build_parser().parse_args(["attachment", "svc", "-j", "0"])
+
+
+def test_command_attachment_stdout_error(capsys):
+    class FailingQuery(api.Query):
+        def search(self, service):
+            return [{"id": "item", "type": 1, "name": "kube", "attachments": [{"id": "a1", "fileName": "config"}]}]
+
+        def get_attachment(self, credential, attachment, out):
+            raise ValueError("Attachment not found.")
+
+    ui = bitwarden.UI.__new__(bitwarden.UI)
+    ui.query = FailingQuery(None)
+
+    ui.command_attachment(argparse.Namespace(service="kube", name=[], output="-", jobs=1))
+
+    assert capsys.readouterr().err == "Attachment not found.\n"
+
+
+def test_download_attachments_partial_failure_saves_manifest(monkeypatch, wrapper, tmp_path):
+    fake_cli(
+        monkeypatch,
+        wrapper,
+        "import sys\n"
+        "if 'a2' in sys.argv: sys.stderr.write('Not found.'); sys.exit(1)\n"
+        "sys.stdout.write('ok')",
+    )
+    credential = {
+        "id": "item",
+        "attachments": [
+            {"id": "a1", "fileName": "one", "size": "2"},
+            {"id": "a2", "fileName": "two", "size": "2"},
+        ],
+    }
+    manifest = AttachmentManifest(str(tmp_path / "attachments.json"))
+
+    with pytest.raises(ValueError, match="Not found."):
+        api.Query(wrapper).download_attachments(
+            credential, credential["attachments"], str(tmp_path / "out"), manifest=manifest
+        )
+
+    saved = AttachmentManifest(manifest.path)
+    assert list(saved.entries) == [str(tmp_path / "out" / "one")]
@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import bitwarden
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+
+# Cold start of `bitwarden.py --help`, interpreter startup included.
+HELP_BUDGET = 0.5
+
+
+def run_cli(*args):
+    return subprocess.run(
+        [sys.executable, os.path.join(SRC, "bitwarden.py")] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=SRC,
+    )
+
+
+def test_help_cold_start_budget():
+    run_cli("--help")  # warm the OS file cache, not the interpreter
+
+    start = time.perf_counter()
+    result = run_cli("--help")
+    elapsed = time.perf_counter() - start
+
+    assert result.returncode == 0
+    assert b"sub-command help" in result.stdout
+    assert elapsed < HELP_BUDGET
+
+
+def test_build_parser_does_not_import_api():
+    code = (
+        "import sys, bitwarden\n"
+        "bitwarden.build_parser().parse_args(['get', 'a'])\n"
+        "assert 'lib.api' not in sys.modules\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC)
+    assert result.returncode == 0
+
+
+def test_main_usage_error_skips_wrapper(monkeypatch):
+    from lib import api
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Wrapper built before argument parsing")
+
+    monkeypatch.setattr(api, "Wrapper", fail)
+
+    with pytest.raises(SystemExit) as exc:
+        bitwarden.main(["get"])
+    assert exc.value.code == 2
+
+
+def test_main_no_command(monkeypatch, capsys):
+    from lib import api
+
+    monkeypatch.setattr(api, "Wrapper", None)
+
+    assert bitwarden.main([]) == 2
+    assert "sub-command help" in capsys.readouterr().out
+
+
+def test_main_dispatch(monkeypatch):
+    from lib import api
+
+    calls = []
+    monkeypatch.setattr(api, "Wrapper", lambda: "wrapper")
+    monkeypatch.setattr(bitwarden.UI, "unlock", lambda self: calls.append("unlock"))
+    monkeypatch.setattr(
+        bitwarden.UI, "command_get", lambda self, args: calls.append(args.service)
+    )
+
+    assert bitwarden.main(["get", "example.com"]) == 0
+    assert calls == ["unlock", "example.com"]
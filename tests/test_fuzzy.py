@@ -0,0 +1,94 @@
+import pytest
+
+import bitwarden
+from lib.fuzzy import Matcher
+
+
+def item(name, username=None, *uris):
+    return {
+        "type": 1,
+        "name": name,
+        "login": {"username": username, "uris": [{"uri": u} for u in uris]},
+    }
+
+
+ITEMS = [
+    item("Personal mail", "me", "https://mail.example.com"),
+    item("GitLab", "dev", "https://gitlab.com"),
+    item("GitHub", "dev", "https://github.com/login"),
+    item("Old github account", "old", "https://github.com"),
+]
+
+
+@pytest.mark.parametrize(
+    "word, text, expected",
+    [
+        ("github", "github", 100),
+        ("git", "github", 80),
+        ("hub", "git hub", 60),
+        ("thu", "github", 40),
+        ("ghb", "github", 11),
+        ("hg", "github", 0),
+    ],
+)
+def test_score_word(word, text, expected):
+    assert Matcher([]).score_word(word, text, text.split()) == expected
+
+
+def test_rank_best_first():
+    ranked = Matcher(ITEMS).rank("github")
+
+    assert [i["name"] for i in ranked[:2]] == ["GitHub", "Old github account"]
+    # Items not matching the query are kept, last.
+    assert len(ranked) == len(ITEMS)
+
+
+def test_rank_required_narrows():
+    ranked = Matcher(ITEMS).rank("github", required="old")
+
+    assert [i["name"] for i in ranked] == ["Old github account"]
+
+
+def test_rank_required_matches_username_and_host():
+    matcher = Matcher(ITEMS)
+
+    assert [i["name"] for i in matcher.rank(required="me")] == ["Personal mail"]
+    assert [i["name"] for i in matcher.rank(required="gitlab.com")] == ["GitLab"]
+    assert matcher.rank(required="nothing") == []
+
+
+def test_rank_large_vault_scores_candidates_only(monkeypatch):
+    items = [item(f"service {i}", f"user{i}", f"https://host{i}.example.com") for i in range(10000)]
+    items += [item(f"zebra {i}") for i in range(10)]
+    matcher = Matcher(items)
+    scored = []
+    score = matcher.score
+    monkeypatch.setattr(matcher, "score", lambda word, fields: scored.append(word) or score(word, fields))
+
+    ranked = matcher.rank("zebra", required="zeb 3")
+
+    assert [i["name"] for i in ranked] == ["zebra 3"]
+    # Only the zebra items have a "z": the 10000 others are never scored.
+    assert len(matcher.candidates(["zeb"])) == 10
+    assert len(scored) <= 10 * 3
+
+
+def test_select_from_multiple_matches_narrowing(monkeypatch, capsys):
+    answers = iter(["old", "1"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+    ui = bitwarden.UI.__new__(bitwarden.UI)
+
+    assert ui.select_from_multiple_matches(ITEMS, "github") == ITEMS[3]
+    assert "1) GitHub - dev" in capsys.readouterr().out
+
+
+def test_select_from_multiple_matches_limit(monkeypatch, capsys):
+    answers = iter(["2", "1"])
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+    ui = bitwarden.UI.__new__(bitwarden.UI)
+    ui.SELECT_LIMIT = 1
+
+    assert ui.select_from_multiple_matches(ITEMS, "mail") == ITEMS[0]
+    out = capsys.readouterr().out
+    assert "... and 3 more, type text to narrow down." in out
+    assert "No match for '2'." in out
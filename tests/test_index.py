@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from lib.index import NameIndex, get_cache_location
+
+
+def item(id, name, *uris):
+    return {"id": id, "name": name, "login": {"uris": [{"uri": u} for u in uris]}}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return NameIndex(str(tmp_path / "cache" / "names.idx"))
+
+
+def test_get_cache_location():
+    assert get_cache_location({"XDG_CACHE_HOME": "/yay"}) == "/yay/bitwarden-keyring"
+
+
+def test_complete_missing_index(index):
+    assert index.complete("a") == []
+
+
+def test_complete_names_and_hosts(index):
+    index.update(
+        [
+            item("1", "GitHub", "https://github.com/login"),
+            item("2", "GitLab work", "gitlab.example.com"),
+            item("3", "Bank", "https://bank.example"),
+        ]
+    )
+
+    assert index.complete("git") == [
+        "GitHub",
+        "github.com",
+        "GitLab work",
+        "gitlab.example.com",
+    ]
+    assert index.complete("GITH") == ["GitHub", "github.com"]
+    assert index.complete("b", limit=1) == ["Bank"]
+    assert index.complete("zzz") == []
+
+
+def test_update_merges_by_id(index):
+    index.update([item("1", "Old name"), item("2", "Other")])
+    index.update([item("1", "New name")])
+
+    assert index.complete("") == ["New name", "Other"]
+
+
+def test_update_full_replaces(index):
+    index.update([item("1", "Old"), item("2", "Other")])
+    index.update([item("3", "Only")], full=True)
+
+    assert index.complete("") == ["Only"]
+
+
+def test_remove(index):
+    index.update([item("1", "A"), item("2", "B")])
+    index.remove(["1"])
+
+    assert index.complete("") == ["B"]
+
+
+def test_index_is_private(index):
+    index.update([item("1", "A")])
+
+    assert os.stat(index.path).st_mode & 0o077 == 0
+
+
+def test_complete_large_index_never_calls_bw(index, monkeypatch):
+    index.update([item(str(i), f"service {i}", f"https://host{i}.example.com") for i in range(10000)])
+
+    def fail(*args, **kwargs):
+        raise AssertionError("bw called on the completion path")
+
+    monkeypatch.setattr(subprocess, "run", fail)
+    monkeypatch.setattr(subprocess, "Popen", fail)
+
+    assert len(index.complete("host12")) == 111
+    assert index.complete("host12", limit=3) == ["host12.example.com", "host120.example.com", "host1200.example.com"]
+
+
+def test_cli_complete_without_vault(tmp_path):
+    environ = {"XDG_CACHE_HOME": str(tmp_path)}
+    NameIndex.default(environ).update([item("1", "GitHub"), item("2", "Bank")])
+
+    src = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+    code = (
+        "import sys, bitwarden\n"
+        "bitwarden.main(['complete', 'gi'])\n"
+        "assert 'lib.api' not in sys.modules\n"
+        "assert 'subprocess' not in sys.modules\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=src,
+        env=dict(os.environ, PATH="", **environ),
+        stdout=subprocess.PIPE,
+    )
+
+    assert result.returncode == 0
+    assert result.stdout == b"GitHub\n"
@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+
+import bitwarden
+from lib import api
+from lib.index import NameIndex
+
+
+def login(id, name, username="me"):
+    return {"id": id, "type": 1, "name": name, "login": {"username": username, "password": id}}
+
+
+@pytest.fixture
+def multi(fake_wrapper):
+    return api.MultiWrapper(
+        [
+            ("personal", fake_wrapper([login("p1", "GitHub")])),
+            ("org", fake_wrapper([login("o1", "GitHub org"), login("o2", "GitHub", "bot")])),
+        ]
+    )
+
+
+def concurrent(multi):
+    # Each profile's call blocks until all of them are running at once.
+    barrier = threading.Barrier(len(multi.wrappers))
+    for wrapper in multi.wrappers.values():
+        wrapper.barrier = barrier
+    return multi
+
+
+def test_search_fans_out_concurrently(multi, tmp_path):
+    index = NameIndex(str(tmp_path / "names.idx"))
+    query = api.MultiQuery(concurrent(multi), index=index)
+
+    results = query.search("github.com")
+
+    assert [(i["id"], i["profile"]) for i in results] == [
+        ("p1", "personal"),
+        ("o1", "org"),
+        ("o2", "org"),
+    ]
+    assert index.complete("github") == ["GitHub", "GitHub org"]
+
+
+def test_get_password_merges_profiles(multi, tmp_path):
+    index = NameIndex(str(tmp_path / "names.idx"))
+    results = api.MultiQuery(multi, index=index).get_password("github.com", "me")
+
+    assert [(i["id"], i["profile"]) for i in results] == [("p1", "personal"), ("o1", "org")]
+    assert index.complete("github") == ["GitHub", "GitHub org"]
+
+
+def test_operations_routed_to_item_profile(multi):
+    query = api.MultiQuery(multi)
+    item = query.search("github.com")[1]
+
+    query.real_delete_credential(item)
+
+    assert multi.wrappers["org"].calls[-1] == ("delete", "item", "o1")
+    assert multi.wrappers["personal"].calls == [("list", "items", "--search", "github.com")]
+
+
+def test_try_get_session_concurrent(multi):
+    concurrent(multi).try_get_session()
+
+    assert multi.unlocked
+
+
+def test_display_credentials_profile(multi):
+    ui = bitwarden.UI(multi)
+
+    assert isinstance(ui.query, api.MultiQuery)
+    assert ui.display_credentials({"1": dict(login("o1", "GitHub"), profile="org")}) == "1) [org] GitHub - me"
+
+
+@pytest.mark.parametrize(
+    "specs, environ, expected",
+    [
+        ([], {}, []),
+        (["a=/x", "b=/y"], {"BITWARDEN_PROFILES": "c=/z"}, [("a", "/x"), ("b", "/y")]),
+        ([], {"BITWARDEN_PROFILES": "c=/z:d=/w"}, [("c", "/z"), ("d", "/w")]),
+    ],
+)
+def test_parse_profiles(specs, environ, expected):
+    assert bitwarden.parse_profiles(specs, environ) == expected
+
+
+def test_parse_profiles_invalid():
+    with pytest.raises(SystemExit):
+        bitwarden.parse_profiles(["nodir"], {})
+
+
+def test_failing_profile_does_not_lose_others(multi, fake_wrapper, capsys):
+    multi.wrappers["locked"] = fake_wrapper(error=ValueError("Vault is locked."))
+    query = api.MultiQuery(multi)
+
+    results = query.search("github.com")
+
+    assert {i["profile"] for i in results} == {"personal", "org"}
+    assert "Profile locked failed: Vault is locked." in capsys.readouterr().err
+
+
+def test_all_profiles_failing_raises(fake_wrapper):
+    multi = api.MultiWrapper([("a", fake_wrapper(error=ValueError())), ("b", fake_wrapper(error=ValueError()))])
+
+    with pytest.raises(ValueError):
+        api.MultiQuery(multi).search("github.com")
+
+
+def test_profile_does_not_inherit_shell_session(monkeypatch, tmp_path):
+    monkeypatch.setenv("BW_SESSION", "shell")
+    monkeypatch.setattr(api.Wrapper, "bitwarden_cli_installed", lambda self: True)
+
+    assert "BW_SESSION" not in api.Wrapper(appdata_dir=str(tmp_path)).environ
+    assert api.Wrapper(appdata_dir=str(tmp_path), session="own").environ["BW_SESSION"] == "own"
+    assert api.Wrapper().environ["BW_SESSION"] == "shell"
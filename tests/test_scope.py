@@ -0,0 +1,186 @@
+import argparse
+import base64
+import json
+
+import pytest
+
+import bitwarden
+from lib import api
+from lib.config import get_config_location, load_scope
+
+ITEMS = [
+    {"id": "1", "type": 1, "name": "GitHub", "login": {"username": "me", "password": "a"}},
+    {"id": "2", "type": 2, "name": "GitHub recovery codes", "notes": "...", "login": None},
+]
+
+
+TEMPLATE = b'{"organizationId": null, "folderId": null, "name": "", "notes": null, "login": null}'
+
+
+def test_get_config_location():
+    assert get_config_location({"XDG_CONFIG_HOME": "/yay"}) == "/yay/bitwarden-keyring/config.ini"
+
+
+def test_load_scope(tmp_path):
+    path = tmp_path / "config.ini"
+    path.write_text("[scope]\norganizationid = org\nfolderid = null\ntype = login\nurl = yes\n")
+
+    assert load_scope(str(path)) == {
+        "organizationid": "org",
+        "folderid": "null",
+        "type": "login",
+        "url": True,
+    }
+
+
+def test_load_scope_no_config(tmp_path):
+    assert load_scope(str(tmp_path / "missing.ini")) == {}
+
+
+def test_search_unscoped(fake_wrapper):
+    bw = fake_wrapper(ITEMS)
+
+    assert api.Query(bw).search("https://github.com") == ITEMS
+    assert bw.calls == [("list", "items", "--search", "github.com")]
+
+
+def test_search_scoped(fake_wrapper):
+    bw = fake_wrapper(ITEMS)
+    query = api.Query(bw, scope={"organizationid": "org", "collectionid": "col", "type": "login"})
+
+    assert query.search("github") == ITEMS[:1]
+    assert bw.calls == [
+        ("list", "items", "--search", "github", "--organizationid", "org", "--collectionid", "col")
+    ]
+
+
+@pytest.mark.parametrize(
+    "service, expected",
+    [
+        ("https://login.github.com/", ("--url", "https://login.github.com/")),
+        # Not an URL: --url would not match anything
+        ("github", ("--search", "github")),
+    ],
+)
+def test_search_url(fake_wrapper, service, expected):
+    bw = fake_wrapper(ITEMS)
+
+    api.Query(bw, scope={"url": True, "folderid": "f"}).search(service)
+
+    assert bw.calls == [("list", "items") + expected + ("--folderid", "f")]
+
+
+def test_list_items_scoped(fake_wrapper):
+    bw = fake_wrapper(ITEMS)
+
+    assert api.Query(bw, scope={"type": 2}).list_items() == ITEMS[1:]
+    assert bw.calls == [("list", "items")]
+
+
+def test_multi_query_scope(fake_wrapper):
+    multi = api.MultiWrapper([("a", fake_wrapper(ITEMS)), ("b", fake_wrapper(ITEMS))])
+
+    api.MultiQuery(multi, scope={"folderid": "f"}).search("github")
+
+    for wrapper in multi.wrappers.values():
+        assert wrapper.calls == [("list", "items", "--search", "github", "--folderid", "f")]
+
+
+def test_main_scope_options(fake_wrapper, monkeypatch, tmp_path):
+    write_config(tmp_path, "[scope]\norganizationid = org\ntype = note\n")
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(api, "Wrapper", fake_wrapper)
+    monkeypatch.setattr(bitwarden.UI, "unlock", lambda self: None)
+    scopes = []
+    monkeypatch.setattr(bitwarden.UI, "command_add", lambda self, args: scopes.append(self.query.scope))
+
+    assert bitwarden.main(["--folder", "f", "--type", "login", "add", "pass"]) == 0
+    assert scopes == [{"organizationid": "org", "folderid": "f", "type": "login"}]
+
+
+def created_item(bw):
+    command, item, payload = bw.calls[-1]
+    assert (command, item) == ("create", "item")
+    return json.loads(base64.b64decode(payload))
+
+
+@pytest.mark.parametrize(
+    "scope, expected",
+    [
+        ({}, {"organizationId": None, "folderId": None}),
+        ({"folderid": "null"}, {"organizationId": None, "folderId": None}),
+        ({"organizationid": "null"}, {"organizationId": None, "collectionIds": None}),
+        ({"organizationid": "notnull", "collectionid": "notnull"}, {"organizationId": None, "collectionIds": None}),
+        ({"collectionid": "null", "folderid": "notnull"}, {"folderId": None, "collectionIds": None}),
+        (
+            {"folderid": "f", "organizationid": "org", "collectionid": "col"},
+            {"organizationId": "org", "folderId": "f", "collectionIds": ["col"]},
+        ),
+    ],
+)
+def test_set_password_scoped(fake_wrapper, scope, expected):
+    bw = fake_wrapper(TEMPLATE)
+
+    api.Query(bw, scope=scope).set_password("https://example.com", "me", "pw")
+
+    item = created_item(bw)
+    assert {k: item.get(k) for k in expected} == expected
+    assert item["login"]["password"] == "pw"
+
+
+def test_add_scoped(fake_wrapper):
+    bw = fake_wrapper(TEMPLATE)
+    args = argparse.Namespace(
+        type="note", name="Recovery", notes="...", username=None, password=None, url=None, secureNote=None
+    )
+
+    api.Query(bw, scope={"folderid": "f", "organizationid": "org"}).add(args)
+
+    item = created_item(bw)
+    assert (item["folderId"], item["organizationId"], item["name"]) == ("f", "org", "Recovery")
+
+
+@pytest.mark.parametrize("content", ["type = securenote", "type = 7", "url = maybe"])
+def test_load_scope_invalid(tmp_path, content):
+    path = tmp_path / "config.ini"
+    path.write_text(f"[scope]\n{content}\n")
+
+    with pytest.raises(ValueError):
+        load_scope(str(path))
+
+
+def test_load_scope_type_number(tmp_path):
+    path = tmp_path / "config.ini"
+    path.write_text("[scope]\ntype = 2\n")
+
+    assert api.Query(None, scope=load_scope(str(path))).item_type == 2
+
+
+def write_config(tmp_path, content):
+    (tmp_path / "bitwarden-keyring").mkdir()
+    (tmp_path / "bitwarden-keyring" / "config.ini").write_text(content)
+
+
+def test_main_invalid_config(fake_wrapper, monkeypatch, tmp_path):
+    write_config(tmp_path, "[scope]\ntype = securenote\n")
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    monkeypatch.setattr(api, "Wrapper", fake_wrapper)
+
+    with pytest.raises(SystemExit) as exc:
+        bitwarden.main(["get", "a"])
+    assert "Invalid item type 'securenote'" in str(exc.value)
+
+
+@pytest.mark.parametrize("options, expected", [([], True), (["--no-match-url"], False)])
+def test_main_no_match_url(fake_wrapper, monkeypatch, tmp_path, options, expected):
+    write_config(tmp_path, "[scope]\nurl = yes\n")
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    monkeypatch.setattr(api, "Wrapper", fake_wrapper)
+    monkeypatch.setattr(bitwarden.UI, "unlock", lambda self: None)
+    scopes = []
+    monkeypatch.setattr(bitwarden.UI, "command_get", lambda self, args: scopes.append(self.query.scope))
+
+    assert bitwarden.main(options + ["get", "a"]) == 0
+    assert scopes == [{"url": expected}]
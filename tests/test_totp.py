@@ -0,0 +1,127 @@
+import argparse
+import base64
+
+import pytest
+
+import bitwarden
+from lib import api
+from lib.totp import TOTP, decode_secret
+
+# RFC 6238 appendix B seeds.
+SHA1 = base64.b32encode(b"12345678901234567890").decode()
+SHA256 = base64.b32encode(b"1234567890" * 3 + b"12").decode()
+SHA512 = base64.b32encode(b"1234567890" * 6 + b"1234").decode()
+
+
+def test_decode_secret_lenient():
+    assert decode_secret("gezd gnbv-gy3t qojq") == b"1234567890"
+
+
+@pytest.mark.parametrize(
+    "at, expected", [(59, "94287082"), (1111111109, "07081804"), (20000000000, "65353130")]
+)
+def test_code_rfc6238_sha1(at, expected):
+    assert TOTP(SHA1, digits=8).code(at) == expected
+
+
+@pytest.mark.parametrize(
+    "secret, algorithm, expected",
+    [(SHA256, "SHA256", "46119246"), (SHA512, "sha512", "90693936")],
+)
+def test_code_rfc6238_algorithms(secret, algorithm, expected):
+    assert TOTP(secret, digits=8, algorithm=algorithm).code(59) == expected
+
+
+def test_parse_plain_secret():
+    totp = TOTP.parse(SHA1)
+
+    assert (totp.digits, totp.period, totp.algorithm) == (6, 30, "sha1")
+    assert totp.code(59) == "287082"
+
+
+def test_parse_otpauth_uri():
+    totp = TOTP.parse(
+        f"otpauth://totp/Example:me@example.com?secret={SHA256}"
+        "&issuer=Example&algorithm=SHA256&digits=8&period=60"
+    )
+
+    assert (totp.digits, totp.period, totp.algorithm) == (8, 60, "sha256")
+    assert totp.code(119) == TOTP(SHA256, digits=8, algorithm="sha256").code(59)
+
+
+def test_parse_steam():
+    code = TOTP.parse(f"steam://{SHA1}").code(59)
+
+    assert len(code) == 5
+    assert set(code) <= set("23456789BCDFGHJKMNPQRTVWXY")
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "otpauth://hotp/x?secret=GEZDGNBV&counter=1",
+        "otpauth://totp/x?issuer=nosecret",
+        f"otpauth://totp/x?secret={SHA1}&algorithm=md5",
+        "not base32!",
+    ],
+)
+def test_parse_invalid(value):
+    with pytest.raises(ValueError):
+        TOTP.parse(value)
+
+
+def test_remaining():
+    assert TOTP(SHA1).remaining(59) == 1
+    assert TOTP(SHA1).remaining(60) == 30
+
+
+def test_query_get_totp():
+    query = api.Query(bw=None)
+
+    assert query.get_totp({"login": {"totp": SHA1}}, at=59) == "287082"
+    assert query.get_totp({"login": {"totp": None}}) is None
+    assert query.get_totp({"type": 2, "login": None}) is None
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        f"otpauth://totp/x?secret={SHA1}&period=0",
+        f"otpauth://totp/x?secret={SHA1}&digits=0",
+        f"otpauth://totp/x?secret={SHA1}&digits=11",
+        f"otpauth://totp/x?secret={SHA1}&period=abc",
+    ],
+)
+def test_parse_invalid_parameters(value):
+    with pytest.raises(ValueError):
+        TOTP.parse(value)
+
+
+class FakeQuery(api.Query):
+    def __init__(self, items):
+        super().__init__(bw=None)
+        self.items = items
+
+    def search(self, service):
+        return [item for item in self.items if item["name"] == service]
+
+
+def test_command_totp_continues_after_invalid(monkeypatch, capsys):
+    ui = bitwarden.UI.__new__(bitwarden.UI)
+    ui.query = FakeQuery(
+        [
+            {"name": "bad", "type": 1, "login": {"totp": f"otpauth://totp/x?secret={SHA1}&period=0"}},
+            {"name": "md5", "type": 1, "login": {"totp": f"otpauth://totp/x?secret={SHA1}&algorithm=md5"}},
+            {"name": "good", "type": 1, "login": {"totp": SHA1}},
+        ]
+    )
+    monkeypatch.setattr("time.time", lambda: 59)
+
+    ui.command_totp(argparse.Namespace(service=["bad", "missing", "md5", "good"]))
+
+    captured = capsys.readouterr()
+    assert captured.out == "good\t287082\n"
+    assert "Invalid TOTP for bad: Invalid TOTP period: 0" in captured.err
+    assert "No TOTP found for missing" in captured.err
+    assert "Invalid TOTP for md5" in captured.err
+    assert "TOTP for good expires in 1s" in captured.err
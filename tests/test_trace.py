@@ -0,0 +1,176 @@
+import io
+import json
+import sys
+
+import pytest
+
+import bitwarden
+from lib import api
+from lib.trace import Recorder, Redactor, ReplayError, ReplayWrapper, command_name
+
+ITEMS = [
+    {
+        "id": "4f3a",
+        "type": 1,
+        "name": "GitHub work",
+        "login": {
+            "username": "jdoe",
+            "password": "hunter2",
+            "uris": [{"match": None, "uri": "https://github.com/login"}],
+        },
+        "attachments": [{"id": "a1", "fileName": "id_rsa", "size": "1234"}],
+    }
+]
+
+
+@pytest.mark.parametrize(
+    "args, expected",
+    [
+        (["list", "items", "--search", "foo"], "list items"),
+        (["unlock", "--raw", "pw"], "unlock"),
+        (["sync"], "sync"),
+        (["delete", "item", "id"], "delete item"),
+    ],
+)
+def test_command_name(args, expected):
+    assert command_name(args) == expected
+
+
+def test_redactor_keeps_shape():
+    redactor = Redactor(salt=b"salt")
+    redacted = redactor.redact(ITEMS)
+
+    item = redacted[0]
+    assert item["type"] == 1
+    assert item["login"]["uris"][0]["match"] is None
+    assert item["login"]["password"] == "*******"
+    uri = item["login"]["uris"][0]["uri"]
+    assert uri.count(".") == 1 and "://" in uri and uri.endswith("/" + uri.split("/")[-1])
+    assert "github" not in json.dumps(redacted).lower()
+    # Same word, same pseudonym: the name still matches the host.
+    assert item["name"].split()[0].casefold() == uri.split("//")[1].split(".")[0]
+    assert item["name"][0].isupper() and item["name"][3].isupper()
+    assert item["attachments"][0]["size"].isdigit()
+
+
+def test_redactor_replaces_secrets_entirely():
+    item = {
+        "name": "Bank",
+        "notes": "pin: 1234!",
+        "login": {"password": "%$#@!", "totp": "otpauth://totp/x?secret=ABC"},
+        "fields": [{"name": "pin_code", "value": "p@ss_w0rd!", "type": 1}],
+        "card": {"number": "4111-1111", "code": "123", "expYear": "2030"},
+        "passwordHistory": [{"password": "correct-horse-battery!!", "lastUsedDate": None}],
+    }
+
+    redacted = Redactor().redact(item)
+
+    assert redacted["notes"] == "*" * 10
+    assert redacted["login"] == {"password": "*****", "totp": "*" * 27}
+    assert redacted["fields"][0]["value"] == "*" * 10
+    assert redacted["fields"][0]["type"] == 1
+    assert redacted["card"] == {"number": "*" * 9, "code": "***", "expYear": "****"}
+    assert redacted["passwordHistory"][0]["password"] == "*" * 23
+
+
+def test_redact_args():
+    redactor = Redactor(salt=b"salt")
+
+    assert redactor.redact_args(["login", "--raw", "me@example.com", "%$#@!"]) == [
+        "login", "--raw", "*" * 14, "*****",
+    ]
+    assert redactor.redact_args(["unlock", "--raw", "p@ss_w0rd!"]) == ["unlock", "--raw", "*" * 10]
+    args = redactor.redact_args(["list", "items", "--search", "my_bank"])
+    assert args[:3] == ["list", "items", "--search"] and args[3] != "my_bank"
+
+
+def test_redact_output_session_key():
+    redactor = Redactor()
+
+    assert redactor.redact_output(b"aB+c/d==", "unlock") == {"text": "********"}
+
+
+@pytest.mark.parametrize(
+    "output, command, expected",
+    [
+        (b"123456", "get password", "******"),
+        (b'"hunter2"', "get password", "*********"),
+        (b"042137", "get totp", "******"),
+        (b'{"pin": 1234}', "get notes", "*" * 13),
+    ],
+)
+def test_redact_output_secret_commands_json(output, command, expected):
+    assert Redactor().redact_output(output, command) == {"text": expected}
+
+
+def test_redact_secret_scalars():
+    redacted = Redactor().redact(
+        {"type": 1, "card": {"number": 4111111111111111, "expired": True, "brand": None}}
+    )
+
+    assert redacted == {"type": 1, "card": {"number": "*" * 16, "expired": "****", "brand": None}}
+
+
+def fake_run(monkeypatch, stdout):
+    monkeypatch.setattr(
+        api.subprocess, "run", lambda *args, **kwargs: type("Result", (), {"stdout": stdout})
+    )
+
+
+def test_record_and_replay(monkeypatch, wrapper, tmp_path):
+    trace = str(tmp_path / "trace.jsonl")
+    wrapper.recorder = Recorder(trace)
+
+    fake_run(monkeypatch, json.dumps(ITEMS).encode("utf-8"))
+    assert api.Query(wrapper).search("https://github.com") == ITEMS
+
+    def fail(*args, **kwargs):
+        raise api.subprocess.CalledProcessError(1, "bw", output=b"Invalid master password.")
+
+    monkeypatch.setattr(api.subprocess, "run", fail)
+    with pytest.raises(api.BWWrapperWrongPasswordError):
+        wrapper.bw("unlock", "--raw", "hunter2", session=False)
+
+    content = open(trace).read()
+    assert "hunter2" not in content and "github" not in content.lower()
+    events = [json.loads(line) for line in content.splitlines()]
+    assert [e["command"] for e in events] == ["list items", "unlock"]
+    assert events[1]["error"] == "wrong_password"
+
+    replay = ReplayWrapper(trace, speed=0)
+    replay.try_get_session()
+    assert replay.unlocked
+
+    with pytest.raises(api.BWWrapperWrongPasswordError):
+        replay.bw("unlock", "--raw", "other")
+    items = api.Query(replay).search("anything")
+    assert items[0]["login"]["uris"][0]["uri"].startswith("https://")
+    with pytest.raises(ReplayError):
+        replay.bw("list", "items")
+
+
+def test_record_and_replay_stream(monkeypatch, wrapper, tmp_path):
+    trace = str(tmp_path / "trace.jsonl")
+    wrapper.recorder = Recorder(trace)
+    monkeypatch.setattr(
+        wrapper, "cli_args", lambda args, session: [sys.executable, "-c", "print('secret' * 10)"]
+    )
+
+    wrapper.bw_stream("get", "attachment", "a1", out=io.BytesIO())
+
+    assert "secret" not in open(trace).read()
+    out = io.BytesIO()
+    assert ReplayWrapper(trace, speed=0).bw_stream("get", "attachment", "x", out=out) == 61
+    assert out.getvalue() == b"\0" * 61
+
+
+def test_cli_replay(tmp_path, capsys):
+    trace = tmp_path / "trace.jsonl"
+    redacted = Redactor().redact(ITEMS)
+    trace.write_text(
+        json.dumps({"command": "list items", "args": [], "elapsed": 0.01, "returncode": 0, "error": None, "json": redacted})
+        + "\n"
+    )
+
+    assert bitwarden.main(["--replay", str(trace), "get", "whatever"]) == 0
+    assert capsys.readouterr().out == redacted[0]["login"]["password"] + "\n"